@@ -1,12 +1,15 @@
 import os
-import json
-import time
-from flask import Flask, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
+import queue
+from flask import Flask, Response, request, jsonify
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_cors import CORS
-from config import db_config
+from models import db, init_db, User
+from social_store import SocialStore
+from sql_store import SqlSocialStore
+from response_cache import ResponseCache
+from pubsub import EventHub
+from password_pool import PasswordPool, PoolBusy
+from metrics import route_metrics, phase
 
 app = Flask(__name__)
 CORS(app)
@@ -16,70 +19,94 @@ database_folder = os.path.join(os.getcwd(), "database")
 os.makedirs(database_folder, exist_ok=True)
 social_data_path = os.path.join(database_folder, "social_data.json")
 
-# Configure the database using config.py
-app.config['SQLALCHEMY_DATABASE_URI'] = f"mysql+mysqlconnector://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Where posts and follows live: "json" (social_data.json, one process) or
+# "sql" (the SQL database, can be shared by several workers)
+app.config['SOCIAL_STORE'] = os.environ.get('SOCIAL_STORE', 'json')
 app.secret_key = 'SuperDuperSecretKey'
 
+# bcrypt work factor and the size of the password hashing pool. Every
+# gunicorn worker has its own pool, so by default the cores are shared out
+# between the WEB_CONCURRENCY workers (gunicorn's default for -w).
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+web_workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+app.config['PASSWORD_POOL_WORKERS'] = int(os.environ.get('PASSWORD_POOL_WORKERS', max((os.cpu_count() or 1) // web_workers, 1)))
+app.config['PASSWORD_POOL_MAX_PENDING'] = int(os.environ.get('PASSWORD_POOL_MAX_PENDING', app.config['PASSWORD_POOL_WORKERS'] * 4))
+
 # Initialize extensions
-db = SQLAlchemy(app)
-bcrypt = Bcrypt(app)
+init_db(app)
 jwt = JWTManager(app)
 
-# Ensure social_data.json exists
-if not os.path.exists(social_data_path):
-    with open(social_data_path, "w") as f:
-        json.dump({"users": []}, f, indent=4)
+# Start the hashing workers before any background threads exist
+password_pool = PasswordPool(workers=app.config['PASSWORD_POOL_WORKERS'],
+                             max_pending=app.config['PASSWORD_POOL_MAX_PENDING'],
+                             rounds=app.config['BCRYPT_LOG_ROUNDS'])
+password_pool.start()
 
-# Define User model for SQLAlchemy
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(200), nullable=False)
+# Count time spent in SQL queries in the per-route metrics
+with app.app_context():
+    route_metrics.instrument_engine(db.engine)
 
 # Create DB tables
-with app.app_context():
-    db.create_all()
+if app.config['SOCIAL_STORE'] == 'sql':
+    social_store = SqlSocialStore()
+    with app.app_context():
+        social_store.setup()
+else:
+    with app.app_context():
+        db.create_all()
+
+    # Load social_data.json and its change log into memory once
+    social_store = SocialStore(social_data_path)
+    social_store.start_compactor()
+
+# Serialized /posts pages, thrown away whenever the social data changes
+feed_cache = ResponseCache()
+
+# Pushes post-created/post-deleted events to /posts/stream listeners
+post_events = EventHub()
+STREAM_HEARTBEAT_SECONDS = 15
+
+# Time every request for /metrics
+@app.before_request
+def start_timer():
+    request.metrics_started = route_metrics.begin_request()
+
+@app.after_request
+def record_timing(response):
+    started = getattr(request, "metrics_started", None)
+    if started is not None:
+        route = f"{request.method} {request.url_rule.rule}" if request.url_rule else "unmatched"
+        route_metrics.end_request(route, response.status_code, started)
+    return response
+
+# Too many logins/registrations at once, so turn this one away instead of queueing it
+def password_pool_busy():
+    response = jsonify({"message": "Server is busy, try again in a moment"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
 
 # Register a new user
 @app.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
 
+    # Deleted accounts are renamed to this, so nobody can register it
+    if data['username'] == "Deleted Account":
+        return jsonify({"message": "Username is not allowed"}), 400
+
     if User.query.filter_by(username=data['username']).first():
         return jsonify({"message": "Username already exists"}), 400
 
-    hashed_password = bcrypt.generate_password_hash(data['password']).decode('utf-8')
+    try:
+        hashed_password = password_pool.hash(data['password'])
+    except PoolBusy:
+        return password_pool_busy()
     new_user = User(username=data['username'], email=data['email'], password=hashed_password)
     db.session.add(new_user)
     db.session.commit()
 
-    # Load existing social data
-    if os.path.exists(social_data_path):
-        with open(social_data_path, "r") as f:
-            try:
-                social_data = json.load(f)
-            except json.JSONDecodeError:
-                social_data = {"users": []}
-    else:
-        social_data = {"users": []}
-
     # Add new user to social data with default role
-    new_user_data = {
-        "id": new_user.id,
-        "username": new_user.username,
-        "role": "User",  # Default role
-        "user-made": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
-        "posts": [],
-        "following": [],
-        "followers": []
-    }
-    social_data["users"].append(new_user_data)
-
-    # Save social data
-    with open(social_data_path, "w") as f:
-        json.dump(social_data, f, indent=4)
+    social_store.add_user(new_user.id, new_user.username)
 
     return jsonify({"message": "User created successfully"}), 201
 
@@ -89,7 +116,11 @@ def register():
 def login():
     data = request.get_json()
     user = User.query.filter_by(username=data['username']).first()
-    if user and bcrypt.check_password_hash(user.password, data['password']):
+    try:
+        password_ok = user is not None and password_pool.check(user.password, data['password'])
+    except PoolBusy:
+        return password_pool_busy()
+    if password_ok:
         access_token = create_access_token(identity=user.username)
         return jsonify(access_token=access_token), 200
     return jsonify({"message": "Invalid username or password"}), 401
@@ -99,23 +130,38 @@ def login():
 @jwt_required()
 def protected():
     current_user = get_jwt_identity()
-    
-    # Fetch user role from social_data.json
-    if os.path.exists(social_data_path):
-        with open(social_data_path, "r") as f:
-            try:
-                social_data = json.load(f)
-            except json.JSONDecodeError:
-                return jsonify({"message": "Error reading social data"}), 500
-    else:
-        return jsonify({"message": "Social data file not found"}), 500
 
-    user_info = next((user for user in social_data["users"] if user["username"] == current_user), None)
-    if user_info:
-        role = user_info.get("role", "User")
-        return jsonify(message=f"You have logged in, {current_user}, Role: {role}"), 200
+    # Fetch user role from social data
+    identity = social_store.get_identity(current_user)
+    if identity:
+        return jsonify(message=f"You have logged in, {current_user}, Role: {identity['role']}"), 200
     return jsonify({"message": "User not found"}), 404
 
+# The logged in user as {username, role, id}
+@app.route('/me', methods=['GET'])
+@jwt_required()
+def me():
+    identity = social_store.get_identity(get_jwt_identity())
+    if identity:
+        return jsonify(identity), 200
+    return jsonify({"message": "User not found"}), 404
+
+# Change a user's role (Admins only)
+@app.route('/users/<username>/role', methods=['PUT'])
+@jwt_required()
+def set_role(username):
+    identity = social_store.get_identity(get_jwt_identity())
+    if not identity or identity["role"] != "Admin":
+        return jsonify({"message": "Only admins can change roles"}), 403
+
+    role = (request.get_json(silent=True) or {}).get('role')
+    if role not in ("User", "Moderator", "Admin"):
+        return jsonify({"message": "Role must be User, Moderator or Admin"}), 400
+
+    if not social_store.set_role(username, role):
+        return jsonify({"message": "User not found"}), 404
+    return jsonify({"message": f"{username} is now {role}"}), 200
+
 # Delete Account
 @app.route('/delete-account', methods=['DELETE'])
 @jwt_required()
@@ -130,29 +176,10 @@ def delete_account():
     else:
         return jsonify({"message": "User not found in SQL database"}), 404
 
-    # Step 2: Update social_data.json
-    if os.path.exists(social_data_path):
-        with open(social_data_path, "r") as f:
-            try:
-                social_data = json.load(f)
-            except json.JSONDecodeError:
-                return jsonify({"message": "Error reading social data"}), 500
-    else:
-        return jsonify({"message": "Social data file not found"}), 500
-
-    user_found = False
-    for user in social_data["users"]:
-        if user["username"] == current_user:
-            user["username"] = "Deleted Account"
-            user_found = True
-            break
-
-    if not user_found:
+    # Step 2: Update social data
+    if not social_store.rename_user(current_user, "Deleted Account"):
         return jsonify({"message": "User not found in social data"}), 404
 
-    with open(social_data_path, "w") as f:
-        json.dump(social_data, f, indent=4)
-
     return jsonify({"message": "Account deleted and marked in social data"}), 200
 
 
@@ -165,59 +192,105 @@ def create_post():
     hashtags = data.get('hashtags', [])
     username = get_jwt_identity()
 
-    if os.path.exists(social_data_path):
-        with open(social_data_path, "r") as f:
-            try:
-                social_data = json.load(f)
-            except json.JSONDecodeError:
-                return jsonify({"message": "Error reading social data"}), 500
-    else:
-        return jsonify({"message": "Social data file not found"}), 500
-
-    user_found = False
-    for user in social_data.get("users", []):
-        if user.get("username") == username:
-            post = {
-                "id": int(time.time() * 1000),
-                "message": message,
-                "hashtags": hashtags,
-                "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-            }
-            user.setdefault("posts", []).insert(0, post)
-            user_found = True
-            break
-
-    if not user_found:
+    if not isinstance(message, str):
+        return jsonify({"message": "Message must be a string"}), 400
+    if not isinstance(hashtags, list) or not all(isinstance(tag, str) for tag in hashtags):
+        return jsonify({"message": "Hashtags must be a list of strings"}), 400
+
+    post = social_store.add_post(username, message, hashtags)
+    if post is None:
         return jsonify({"message": "User not found in social data"}), 404
 
-    with open(social_data_path, "w") as f:
-        json.dump(social_data, f, indent=4)
+    post_with_user = dict(post, username=username)
+    post_events.publish("post-created", post_with_user)
 
-    return jsonify({"message": "Post created successfully"}), 201
+    return jsonify({"message": "Post created successfully", "post": post_with_user}), 201
 
-# Get latest posts
+# Read ?before=<post_id>&limit=N for the paged post endpoints
+def page_args():
+    before = request.args.get('before', type=int)
+    limit = min(max(request.args.get('limit', 30, type=int), 1), 100)
+    return limit, before
+
+# Pass next_before back as ?before= to get the next (older) page
+def posts_page(posts_to_return, limit):
+    next_before = posts_to_return[-1]["id"] if len(posts_to_return) == limit else None
+    return jsonify({"posts": posts_to_return, "next_before": next_before}), 200
+
+# Send a cached body with an ETag, gzipped if the client accepts it.
+# Clients that send a matching If-None-Match get an empty 304. The match is
+# weak, as RFC 7232 asks, since proxies like nginx weaken ETags when they gzip.
+def cached_response(entry):
+    use_gzip = entry.can_gzip() and "gzip" in request.accept_encodings
+    etag = entry.gzip_etag if use_gzip else entry.etag
+
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(entry.gzipped() if use_gzip else entry.body, mimetype="application/json")
+        if use_gzip:
+            response.headers["Content-Encoding"] = "gzip"
+    response.set_etag(etag)
+    response.headers["Vary"] = "Accept-Encoding"
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# Get latest posts, a page at a time: /posts?before=<post_id>&limit=N
 @app.route('/posts', methods=['GET'])
 def get_posts():
-    if os.path.exists(social_data_path):
-        with open(social_data_path, "r") as f:
-            try:
-                social_data = json.load(f)
-            except json.JSONDecodeError:
-                return jsonify({"posts": []}), 500
-    else:
-        return jsonify({"posts": []}), 404
-
-    all_posts = []
-    for user in social_data.get("users", []):
-        for post in user.get("posts", []):
-            post_with_user = post.copy()
-            post_with_user["username"] = user["username"]
-            all_posts.append(post_with_user)
+    limit, before = page_args()
+
+    # social_store.seq goes up with every change, so it works as the data version
+    def build():
+        posts_to_return = social_store.latest_posts(limit, before)
+        with phase("json_dump"):
+            response, _ = posts_page(posts_to_return, limit)
+            return response.get_data()
+
+    return cached_response(feed_cache.get((limit, before), social_store.seq, build))
+
+# Live feed updates as server-sent events. Browsers reconnect on their own
+# and send Last-Event-ID, so they get the events they missed in between.
+@app.route('/posts/stream', methods=['GET'])
+def stream_posts():
+    last_event_id = request.headers.get('Last-Event-ID')
+    sub = post_events.subscribe(last_event_id)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not (sub.dropped and sub.queue.empty()):
+                try:
+                    event = sub.queue.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield event.encode()
+        finally:
+            post_events.unsubscribe(sub)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Get the posts of one user
+@app.route('/users/<username>/posts', methods=['GET'])
+def get_user_posts(username):
+    limit, before = page_args()
+    posts_to_return = social_store.user_posts(username, limit, before)
+    if posts_to_return is None:
+        return jsonify({"message": "User not found"}), 404
+    return posts_page(posts_to_return, limit)
 
-    all_posts.sort(key=lambda x: x["id"], reverse=True)
-    posts_to_return = all_posts[:30]
+# Get the posts with a hashtag (with or without the #)
+@app.route('/hashtags/<tag>/posts', methods=['GET'])
+def get_hashtag_posts(tag):
+    limit, before = page_args()
+    return posts_page(social_store.hashtag_posts(tag, limit, before), limit)
 
-    return jsonify({"posts": posts_to_return}), 200
+# List users (id, username and role only)
+@app.route('/users', methods=['GET'])
+def get_users():
+    return jsonify({"users": social_store.list_users()}), 200
 
 # Delete a post endpoint
 @app.route('/posts/<int:post_id>', methods=['DELETE'])
@@ -225,43 +298,29 @@ def get_posts():
 def delete_post(post_id):
     current_user = get_jwt_identity()
 
-    if os.path.exists(social_data_path):
-        with open(social_data_path, "r") as f:
-            try:
-                social_data = json.load(f)
-            except json.JSONDecodeError:
-                return jsonify({"message": "Error reading social data"}), 500
-    else:
-        return jsonify({"message": "Social data file not found"}), 500
-
     # Check if the current user is an admin
-    user_info = next((user for user in social_data["users"] if user["username"] == current_user), None)
-    if not user_info:
+    identity = social_store.get_identity(current_user)
+    if not identity:
         return jsonify({"message": "User not found"}), 404
 
-    # Allow admins to delete any post
-    if user_info.get("role") == "Admin":
-        # Find and delete the post from all users
-        for user in social_data.get("users", []):
-            user["posts"] = [post for post in user.get("posts", []) if post["id"] != post_id]
-
+    # Allow admins to delete any post, regular users can only delete their own posts
+    if identity["role"] == "Admin":
+        deleted = social_store.delete_post(post_id)
     else:
-        # Regular users can only delete their own posts
-        user_found = False
-        for user in social_data.get("users", []):
-            if user.get("username") == current_user:
-                user["posts"] = [post for post in user.get("posts", []) if post["id"] != post_id]
-                user_found = True
-                break
+        deleted = social_store.delete_post(post_id, owner=current_user)
 
-        if not user_found:
-            return jsonify({"message": "User not found in social data"}), 404
-
-    # Save the updated social data
-    with open(social_data_path, "w") as f:
-        json.dump(social_data, f, indent=4)
+    if deleted:
+        post_events.publish("post-deleted", {"id": post_id})
 
     return jsonify({"message": "Post deleted successfully"}), 200
 
+# Server metrics: latency per route (split into json_load, json_dump, fsync
+# and db time) and the password hashing pool
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    snapshot = route_metrics.snapshot()
+    snapshot["password_pool"] = password_pool.metrics()
+    return jsonify(snapshot), 200
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,57 @@
+# Microbenchmark for SocialStore: the lookups behind /protected and /posts
+# should take the same time whether the site has 1k or 100k users.
+#
+#   python benchmarks/bench_store.py
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from social_store import SocialStore
+
+
+def make_social_data(user_count, posts_per_user=3):
+    users = []
+    post_id = 1_700_000_000_000
+    for i in range(user_count):
+        posts = []
+        for _ in range(posts_per_user):
+            post_id += 1
+            posts.insert(0, {"id": post_id, "message": f"post {post_id}", "hashtags": ["#bench"],
+                             "timestamp": "2025-01-01 00:00:00"})
+        users.append({"id": i + 1, "username": f"user{i}", "role": "User", "user-made": "2025-01-01 00:00:00",
+                      "posts": posts, "following": [], "followers": []})
+    return {"users": users}
+
+
+def time_per_call(fn, repeat=2000):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    print(f"{'users':>8} {'load (s)':>10} {'/protected (us)':>16} {'/posts (us)':>12}")
+    for user_count in (1_000, 10_000, 100_000):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "social_data.json")
+            with open(path, "w") as f:
+                json.dump(make_social_data(user_count), f)
+
+            start = time.perf_counter()
+            store = SocialStore(path)
+            load_time = time.perf_counter() - start
+
+            names = [f"user{random.randrange(user_count)}" for _ in range(2000)]
+            it = iter(names * 2)
+            protected = time_per_call(lambda: store.get_user(next(it)).get("role", "User"))
+            posts = time_per_call(lambda: store.latest_posts(30))
+            print(f"{user_count:>8} {load_time:>10.2f} {protected:>16.2f} {posts:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
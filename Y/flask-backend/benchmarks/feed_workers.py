@@ -0,0 +1,69 @@
+# Load test: GET /posts throughput with SOCIAL_STORE=sql behind 1, 4 and 8
+# gunicorn workers (gthread, --threads each, like production). Seeds a SQLite database (or --database-url) through
+# migrate_social_data.py first. Needs gunicorn, so Linux/macOS only.
+#
+#   python benchmarks/feed_workers.py --users 2000 --seconds 10
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+
+from load import drive_http, wait_for_http
+from bench_store import make_social_data
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--posts-per-user", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--threads", type=int, default=8, help="threads per worker")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--database-url", help="default: a fresh SQLite file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   SOCIAL_STORE="sql",
+                   DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(tmp, 'feed.db')}",
+                   PASSWORD_POOL_WORKERS="1",
+                   PYTHONPATH=BACKEND)
+
+        # Seed through the JSON file and the migration tool
+        social_data = make_social_data(args.users, args.posts_per_user)
+        post_ids = [post["id"] for user in social_data["users"] for post in user["posts"]]
+        os.makedirs(os.path.join(tmp, "database"))
+        with open(os.path.join(tmp, "database", "social_data.json"), "w") as f:
+            json.dump(social_data, f)
+        subprocess.run([sys.executable, os.path.join(BACKEND, "migrate_social_data.py")],
+                       cwd=tmp, env=env, check=True)
+
+        # Half the requests read the front page, half a random older page
+        def next_path():
+            if random.random() < 0.5:
+                return "/posts"
+            return f"/posts?before={random.choice(post_ids)}"
+
+        print(f"{'workers':>8} {'req/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'errors':>7}")
+        for workers in args.workers:
+            server = subprocess.Popen(["gunicorn", "-w", str(workers), "-k", "gthread", "--threads", str(args.threads),
+                                       "-b", f"127.0.0.1:{args.port}", "app:app"],
+                                      cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for_http("127.0.0.1", args.port, "/posts")
+                stats = drive_http("127.0.0.1", args.port, next_path, args.clients, args.seconds)
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{workers:>8} {stats['rps']:>10.1f} {stats['p50_ms']:>10.2f} {stats['p99_ms']:>10.2f} {stats['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
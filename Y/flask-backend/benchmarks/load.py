@@ -0,0 +1,71 @@
+# Small helpers shared by the benchmark scripts
+import os
+import sys
+import time
+import threading
+import http.client
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from metrics import percentile
+
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+# Send GET requests from `clients` threads for `seconds` seconds.
+# next_path() picks the path of each request.
+def drive_http(host, port, next_path, clients=16, seconds=10):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        mine = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            try:
+                conn.request("GET", next_path())
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    errors.append(response.status)
+            except OSError as e:
+                errors.append(str(e))
+            finally:
+                conn.close()
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = summarize(latencies, time.perf_counter() - started)
+    stats["errors"] = len(errors)
+    return stats
+
+
+def wait_for_http(host, port, path="/", timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", path)
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on {host}:{port} did not come up")
@@ -0,0 +1,147 @@
+# Benchmark suite for the Flask backend. For every scale it seeds a fresh
+# social_data.json (10 posts per user) and SQLite database, then drives
+# /register, /login, /post, /posts and DELETE /posts/<id> through the Flask
+# test client and reports p50/p99 latency, requests per second and the
+# json_load/json_dump/fsync/db time that /metrics recorded for each route.
+#
+#   python benchmarks/run.py                      # 1k, 10k and 100k posts
+#   python benchmarks/run.py --store sql --scales 10000 --requests 500
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+import subprocess
+
+from bench_store import make_social_data
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND)
+
+POSTS_PER_USER = 10
+
+# Route names as recorded by the metrics middleware
+ROUTES = {
+    "register": "POST /register",
+    "login": "POST /login",
+    "post": "POST /post",
+    "posts": "GET /posts",
+    "delete": "DELETE /posts/<int:post_id>",
+}
+
+
+# Runs in a child process (one per scale), inside the seeded directory
+def drive(requests, seed_post_ids):
+    import time
+    from load import summarize
+    import app as appmod
+
+    client = appmod.app.test_client()
+    results = {}
+
+    def timed(name, calls):
+        latencies = []
+        errors = 0
+        outputs = []
+        started = time.perf_counter()
+        for call in calls:
+            call_started = time.perf_counter()
+            response = call()
+            latencies.append(time.perf_counter() - call_started)
+            if response.status_code >= 400:
+                errors += 1
+            outputs.append(response)
+        results[name] = summarize(latencies, time.perf_counter() - started)
+        results[name]["errors"] = errors
+        return outputs
+
+    names = [f"bench{i}" for i in range(requests)]
+    timed("register", [
+        lambda name=name: client.post("/register", json={"username": name, "email": f"{name}@bench", "password": "pw"})
+        for name in names
+    ])
+    logins = timed("login", [
+        lambda name=name: client.post("/login", json={"username": name, "password": "pw"})
+        for name in names
+    ])
+    headers = [{"Authorization": f"Bearer {response.get_json()['access_token']}"} for response in logins]
+    created = timed("post", [
+        lambda h=h: client.post("/post", json={"message": "benchmark post", "hashtags": ["#bench"]}, headers=h)
+        for h in headers
+    ])
+
+    # Half the reads are the front page, half an older page
+    def feed_path():
+        if random.random() < 0.5 or not seed_post_ids:
+            return "/posts"
+        return f"/posts?before={random.choice(seed_post_ids)}"
+    timed("posts", [lambda: client.get(feed_path()) for _ in range(requests)])
+
+    timed("delete", [
+        lambda h=h, r=r: client.delete(f"/posts/{r.get_json()['post']['id']}", headers=h)
+        for h, r in zip(headers, created)
+    ])
+
+    # Phase breakdown from the metrics middleware
+    routes = appmod.route_metrics.snapshot()["routes"]
+    for name, route in ROUTES.items():
+        phases = routes.get(route, {}).get("phases", {})
+        for phase_name in ("json_load", "json_dump", "fsync", "db"):
+            results[name][f"{phase_name}_ms"] = phases.get(phase_name, {}).get("mean_ms", 0.0)
+    return results
+
+
+def run_scale(posts, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   SOCIAL_STORE=args.store,
+                   DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                   BCRYPT_LOG_ROUNDS=str(args.rounds),
+                   PYTHONPATH=BACKEND)
+
+        social_data = make_social_data(max(posts // POSTS_PER_USER, 1), POSTS_PER_USER)
+        post_ids = [post["id"] for user in social_data["users"] for post in user["posts"]]
+        os.makedirs(os.path.join(tmp, "database"))
+        with open(os.path.join(tmp, "database", "social_data.json"), "w") as f:
+            json.dump(social_data, f)
+        with open(os.path.join(tmp, "post_ids.json"), "w") as f:
+            json.dump(post_ids, f)
+        if args.store == "sql":
+            subprocess.run([sys.executable, os.path.join(BACKEND, "migrate_social_data.py")],
+                           cwd=tmp, env=env, check=True, stdout=subprocess.DEVNULL)
+
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", str(args.requests)],
+                               cwd=tmp, env=env, check=True, capture_output=True, text=True)
+        return json.loads(child.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=int, nargs="+", default=[1_000, 10_000, 100_000],
+                        help="number of seeded posts")
+    parser.add_argument("--store", choices=["json", "sql"], default="json")
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--rounds", type=int, default=4, help="bcrypt work factor")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    if args.child is not None:
+        with open("post_ids.json") as f:
+            print(json.dumps(drive(args.child, json.load(f))))
+        return
+
+    for posts in args.scales:
+        results = run_scale(posts, args)
+        print(f"\n{posts} posts, store={args.store}, {args.requests} requests per route")
+        print(f"{'route':<28} {'req/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'load':>7} {'dump':>7} {'fsync':>7} {'db':>7} {'errors':>6}")
+        for name, route in ROUTES.items():
+            r = results[name]
+            print(f"{route:<28} {r['rps']:>9.1f} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+                  f"{r['json_load_ms']:>7.2f} {r['json_dump_ms']:>7.2f} {r['fsync_ms']:>7.2f} {r['db_ms']:>7.2f} {r['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Time spent in each phase (json_load, json_dump, fsync, db) by the current request
+current_phases = ContextVar("current_phases", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)  # the last bucket is everything slower
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=1000)  # seconds, for percentiles
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def snapshot(self):
+        recent = sorted(self.recent)
+        buckets = {f"le_{bound}ms": count for bound, count in zip(BUCKETS_MS, self.counts)}
+        buckets["slower"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": percentile(recent, 0.50) * 1000,
+            "p99_ms": percentile(recent, 0.99) * 1000,
+            "buckets": buckets,
+        }
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+# Latency per route ("GET /posts"), split into the phases the request spent
+# time in. Phases timed outside a request (startup, the compactor thread)
+# are counted under "background".
+class RouteMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}      # route -> {"total": Histogram, "statuses": {}, "phases": {name: Histogram}}
+        self.background = {}  # phase name -> Histogram
+
+    def begin_request(self):
+        current_phases.set({})
+        return time.perf_counter()
+
+    def end_request(self, route, status, started):
+        elapsed = time.perf_counter() - started
+        phases = current_phases.get() or {}
+        current_phases.set(None)
+        with self.lock:
+            metrics = self.routes.get(route)
+            if metrics is None:
+                metrics = self.routes[route] = {"total": Histogram(), "statuses": {}, "phases": {}}
+            metrics["total"].add(elapsed)
+            metrics["statuses"][status] = metrics["statuses"].get(status, 0) + 1
+            for name, seconds in phases.items():
+                metrics["phases"].setdefault(name, Histogram()).add(seconds)
+
+    def add_phase(self, name, seconds):
+        phases = current_phases.get()
+        if phases is not None:
+            phases[name] = phases.get(name, 0.0) + seconds
+        else:
+            with self.lock:
+                self.background.setdefault(name, Histogram()).add(seconds)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started)
+
+    # Count the time SQLAlchemy spends executing statements as the "db" phase
+    def instrument_engine(self, engine):
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            self.add_phase("db", time.perf_counter() - conn.info["query_started"].pop())
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(context):
+            if context.connection is not None and context.connection.info.get("query_started"):
+                self.add_phase("db", time.perf_counter() - context.connection.info["query_started"].pop())
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "routes": {
+                    route: dict(metrics["total"].snapshot(),
+                                statuses=dict(metrics["statuses"]),
+                                phases={name: h.snapshot() for name, h in metrics["phases"].items()})
+                    for route, metrics in self.routes.items()
+                },
+                "background": {name: h.snapshot() for name, h in self.background.items()},
+            }
+
+
+route_metrics = RouteMetrics()
+phase = route_metrics.phase
@@ -0,0 +1,86 @@
+# One-shot copy of database/social_data.json (and its change log) into the
+# SQL tables used by SOCIAL_STORE=sql. Run it once, with the server stopped:
+#
+#   python migrate_social_data.py [path/to/social_data.json]
+#
+# It uses the same database as app.py (DATABASE_URL or config.py), but
+# doesn't import app.py, so no password workers or compactor get started.
+import os
+import sys
+
+from flask import Flask
+
+from models import db, init_db, SocialUser, Post, Hashtag, Follow, DataVersion, post_hashtag
+from social_store import SocialStore
+from sql_store import SqlSocialStore
+
+BATCH_SIZE = 1000
+
+
+def insert_in_batches(table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(db.insert(table), rows[start:start + BATCH_SIZE])
+
+
+def migrate(path):
+    store = SocialStore(path)
+    SqlSocialStore().setup()
+
+    if db.session.execute(db.select(db.func.count()).select_from(SocialUser)).scalar():
+        sys.exit("The social_user table already has rows, not migrating twice")
+
+    # Users, keeping their order so SocialUser ids follow the JSON file
+    social_users = []
+    for user in store.users:
+        social_users.append(SocialUser(user_id=user.get("id"), username=user["username"],
+                                       role=user.get("role", "User"), user_made=user.get("user-made", "")))
+    db.session.add_all(social_users)
+    db.session.flush()
+    social_ids = [social_user.id for social_user in social_users]
+
+    # Hashtags
+    tag_names = set()
+    for post_id in store.post_ids:
+        tag_names |= store.post_hashtags(post_id)
+    insert_in_batches(Hashtag, [{"name": name} for name in sorted(tag_names)])
+    tag_ids = dict(db.session.execute(db.select(Hashtag.name, Hashtag.id)).all())
+
+    # Posts and their hashtags
+    post_rows = []
+    post_tag_rows = []
+    for user, social_id in zip(store.users, social_ids):
+        for post in user["posts"]:
+            post_rows.append({"id": post["id"], "author_id": social_id, "message": post.get("message", ""),
+                              "hashtags": post.get("hashtags") or [], "timestamp": post.get("timestamp", "")})
+            for name in store.post_hashtags(post["id"]):
+                post_tag_rows.append({"post_id": post["id"], "hashtag_id": tag_ids[name]})
+    insert_in_batches(Post, post_rows)
+    insert_in_batches(post_hashtag, post_tag_rows)
+
+    # Follows. The lists may hold usernames or user ids.
+    by_name = {user["username"]: social_id for user, social_id in zip(store.users, social_ids)
+               if user["username"] != "Deleted Account"}
+    by_user_id = {user.get("id"): social_id for user, social_id in zip(store.users, social_ids)}
+    follows = set()
+    for user, social_id in zip(store.users, social_ids):
+        for other in user.get("following", []):
+            other_id = by_name.get(other, by_user_id.get(other))
+            if other_id is not None and other_id != social_id:
+                follows.add((social_id, other_id))
+        for other in user.get("followers", []):
+            other_id = by_name.get(other, by_user_id.get(other))
+            if other_id is not None and other_id != social_id:
+                follows.add((other_id, social_id))
+    insert_in_batches(Follow, [{"follower_id": a, "followed_id": b} for a, b in sorted(follows)])
+
+    db.session.execute(db.update(DataVersion).where(DataVersion.id == 1).values(version=DataVersion.version + 1))
+    db.session.commit()
+    print(f"Migrated {len(social_users)} users, {len(post_rows)} posts, {len(tag_names)} hashtags "
+          f"and {len(follows)} follows from {path}")
+
+
+if __name__ == '__main__':
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        migrate(sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.getcwd(), "database", "social_data.json"))
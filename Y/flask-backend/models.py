@@ -0,0 +1,87 @@
+import os
+
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+
+# Configure the database using config.py, or DATABASE_URL if it is set
+# (for example DATABASE_URL=sqlite:///y.db to run locally without MariaDB)
+def init_db(app):
+    database_url = os.environ.get('DATABASE_URL')
+    if database_url is None:
+        from config import db_config
+        database_url = f"mysql+mysqlconnector://{db_config['user']}:{db_config['password']}@{db_config['host']}/{db_config['database']}"
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    # Connection pool per worker process. Connections are recycled before the
+    # MariaDB server drops idle ones, and checked before use after a restart.
+    if not database_url.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': 10,
+            'pool_recycle': 1800,
+            'pool_pre_ping': True,
+        }
+
+    db.init_app(app)
+
+
+# Define User model for SQLAlchemy
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password = db.Column(db.String(200), nullable=False)
+
+
+# The tables below hold the social data when SOCIAL_STORE=sql (see sql_store.py)
+
+# A user's social profile. It outlives the User row: a deleted account keeps
+# its posts and is renamed to "Deleted Account", so username isn't unique.
+class SocialUser(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, index=True)  # User.id of the account
+    username = db.Column(db.String(80), nullable=False, index=True)
+    role = db.Column(db.String(20), nullable=False, default="User")
+    user_made = db.Column(db.String(19), nullable=False)
+
+
+post_hashtag = db.Table(
+    "post_hashtag",
+    db.Column("hashtag_id", db.Integer, db.ForeignKey("hashtag.id"), primary_key=True),
+    db.Column("post_id", db.BigInteger, db.ForeignKey("post.id", ondelete="CASCADE"), primary_key=True),
+)
+
+
+# Post ids are millisecond timestamps, so ordering by id is ordering by time
+class Post(db.Model):
+    id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    author_id = db.Column(db.Integer, db.ForeignKey("social_user.id"), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    hashtags = db.Column(db.JSON, nullable=False)  # as the user typed them
+    timestamp = db.Column(db.String(19), nullable=False)
+    tags = db.relationship("Hashtag", secondary=post_hashtag)
+
+    __table_args__ = (
+        db.Index("ix_post_author_id_id", "author_id", "id"),
+    )
+
+
+# Normalized hashtag (see social_store.normalize_hashtag)
+class Hashtag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+
+
+class Follow(db.Model):
+    follower_id = db.Column(db.Integer, db.ForeignKey("social_user.id"), primary_key=True)
+    followed_id = db.Column(db.Integer, db.ForeignKey("social_user.id"), primary_key=True, index=True)
+
+
+# One row, bumped on every change. Used as the data version for response caching.
+class DataVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
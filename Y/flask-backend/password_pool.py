@@ -0,0 +1,158 @@
+import os
+import time
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError, BrokenExecutor
+
+import bcrypt
+
+from metrics import percentile
+
+
+class PoolBusy(Exception):
+    pass
+
+
+# These run in the worker processes
+def hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def check_password(password_hash, password):
+    return bcrypt.checkpw(password.encode("utf-8"), password_hash.encode("utf-8"))
+
+
+def warm_up():
+    return os.getpid()
+
+
+# Runs bcrypt hashing and checking on a pool of worker processes, so a burst
+# of logins can't block the threads that serve everything else. At most
+# max_pending calls can be waiting or running at once; more than that raises
+# PoolBusy straight away instead of queueing up.
+class PasswordPool:
+    def __init__(self, workers=None, max_pending=None, rounds=12, timeout=10):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.rounds = rounds
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.lock = threading.Lock()
+        self.start_lock = threading.Lock()
+        self.executor = None
+        self.kind = None
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.latencies = deque(maxlen=1000)  # seconds, most recent calls
+
+    # Start the workers now, before the app starts any threads of its own.
+    # Worker processes are forked; where fork isn't available (Windows) a
+    # thread pool is used, since spawned workers would re-run app.py.
+    def start(self):
+        with self.start_lock:
+            if self.executor is not None:
+                return self.executor
+            if "fork" in multiprocessing.get_all_start_methods():
+                executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("fork"))
+                kind = "process"
+            else:
+                executor = self.thread_pool()
+                kind = "thread"
+            try:
+                executor.submit(warm_up).result()
+            except BrokenExecutor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            self.executor = executor
+            self.kind = kind
+            return executor
+
+    def thread_pool(self):
+        return ThreadPoolExecutor(self.workers, thread_name_prefix="password-pool")
+
+    # A worker process died (killed, out of memory), which breaks the whole
+    # process pool. By now the server has threads of its own, and a process
+    # forked from it could hang on a lock one of them held, so carry on with
+    # a thread pool instead (bcrypt releases the GIL while hashing).
+    def restart(self, broken):
+        with self.start_lock:
+            if self.executor is not broken:
+                return
+            self.executor = self.thread_pool()
+            self.kind = "thread"
+        with self.lock:
+            self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def hash(self, password):
+        return self.run(hash_password, password, self.rounds)
+
+    def check(self, password_hash, password):
+        return self.run(check_password, password_hash, password)
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise PoolBusy()
+
+        started = time.perf_counter()
+        with self.lock:
+            self.in_flight += 1
+
+        def done(_=None):
+            with self.lock:
+                self.in_flight -= 1
+                self.completed += 1
+                self.latencies.append(time.perf_counter() - started)
+            self.slots.release()
+
+        executor = None
+        future = None
+        try:
+            executor = self.start()
+            future = executor.submit(fn, *args)
+            return future.result(self.timeout)
+        except TimeoutError:
+            with self.lock:
+                self.timeouts += 1
+            raise PoolBusy()
+        except BrokenExecutor:
+            if executor is not None:
+                self.restart(executor)
+            raise PoolBusy()
+        finally:
+            # A call that timed out still has a worker busy, so its slot is
+            # only given back once the worker is done with it
+            if future is not None and not future.done():
+                future.add_done_callback(done)
+            else:
+                done()
+
+    def metrics(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            in_flight = self.in_flight
+            metrics = {
+                "kind": self.kind,
+                "workers": self.workers,
+                "rounds": self.rounds,
+                "max_pending": self.max_pending,
+                "in_flight": in_flight,
+                "queue_depth": max(in_flight - self.workers, 0),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+            }
+        if latencies:
+            metrics["latency_ms"] = {
+                "p50": percentile(latencies, 0.50) * 1000,
+                "p99": percentile(latencies, 0.99) * 1000,
+                "mean": sum(latencies) / len(latencies) * 1000,
+            }
+        return metrics
@@ -0,0 +1,77 @@
+import json
+import queue
+import secrets
+import threading
+from collections import deque
+
+
+class Event:
+    def __init__(self, nonce, number, event_type, data):
+        self.number = number
+        self.id = f"{nonce}-{number}"
+        self.type = event_type
+        self.data = json.dumps(data, separators=(",", ":"))
+
+    # Server-sent events wire format
+    def encode(self):
+        return f"id: {self.id}\nevent: {self.type}\ndata: {self.data}\n\n"
+
+
+class Subscription:
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(max_queue)
+        self.dropped = False
+
+
+# In-process publish/subscribe hub for the /posts/stream endpoint.
+# Every subscriber has its own bounded queue; a subscriber that falls so far
+# behind that its queue fills up is dropped and has to reconnect. The last
+# events are kept so a reconnecting client can resume from Last-Event-ID.
+#
+# Event ids are "<nonce>-<n>", where the nonce is new for every hub. After a
+# restart, or when a reconnect lands on another gunicorn worker, the client's
+# Last-Event-ID has a different nonce and it gets a "reset".
+class EventHub:
+    def __init__(self, max_queue=100, history=500):
+        self.nonce = secrets.token_hex(4)
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.history = deque(maxlen=history)
+        self.last_id = 0
+
+    def publish(self, event_type, data):
+        with self.lock:
+            self.last_id += 1
+            event = Event(self.nonce, self.last_id, event_type, data)
+            self.history.append(event)
+            for sub in list(self.subscribers):
+                try:
+                    sub.queue.put_nowait(event)
+                except queue.Full:
+                    sub.dropped = True
+                    self.subscribers.discard(sub)
+            return event
+
+    # If last_event_id is given, the events after it are queued up first. If
+    # they are no longer all in the history, or the id is from another process,
+    # a "reset" event tells the client to reload the feed instead.
+    def subscribe(self, last_event_id=None):
+        sub = Subscription(self.max_queue)
+        with self.lock:
+            if last_event_id is not None and last_event_id != f"{self.nonce}-{self.last_id}":
+                nonce, _, number = last_event_id.partition("-")
+                number = int(number) if nonce == self.nonce and number.isdigit() else None
+                oldest = self.history[0].number if self.history else self.last_id + 1
+                missed = [event for event in self.history if number is not None and event.number > number]
+                if number is None or number < oldest - 1 or number > self.last_id or len(missed) >= self.max_queue:
+                    sub.queue.put_nowait(Event(self.nonce, self.last_id, "reset", {}))
+                else:
+                    for event in missed:
+                        sub.queue.put_nowait(event)
+            self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
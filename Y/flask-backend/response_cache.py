@@ -0,0 +1,50 @@
+import gzip
+import hashlib
+import threading
+
+
+# A serialized response body with its ETag, plus a gzipped copy made on demand
+class CachedBody:
+    def __init__(self, body, min_gzip_size):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.gzip_etag = self.etag + "-gzip"
+        self.min_gzip_size = min_gzip_size
+        self.gzip_body = None
+
+    def can_gzip(self):
+        return len(self.body) >= self.min_gzip_size
+
+    def gzipped(self):
+        if self.gzip_body is None:
+            self.gzip_body = gzip.compress(self.body, compresslevel=6)
+        return self.gzip_body
+
+
+# Caches response bodies per query for one data version. Every change to the
+# social data bumps the version, which throws the whole cache away.
+class ResponseCache:
+    def __init__(self, max_entries=256, min_gzip_size=1024):
+        self.max_entries = max_entries
+        self.min_gzip_size = min_gzip_size
+        self.lock = threading.Lock()
+        self.version = None
+        self.entries = {}
+
+    # build() must return the body for data at least as new as version
+    def get(self, key, version, build):
+        with self.lock:
+            if version != self.version:
+                self.version = version
+                self.entries = {}
+            entry = self.entries.get(key)
+        if entry is not None:
+            return entry
+
+        entry = CachedBody(build(), self.min_gzip_size)
+        with self.lock:
+            if version == self.version:
+                if len(self.entries) >= self.max_entries:
+                    del self.entries[next(iter(self.entries))]
+                self.entries[key] = entry
+        return entry
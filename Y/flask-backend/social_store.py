@@ -0,0 +1,414 @@
+import os
+import json
+import logging
+import time
+import threading
+from bisect import bisect_left
+
+from metrics import phase
+
+log = logging.getLogger(__name__)
+
+# In-memory copy of social_data.json with indexes, so requests don't have to
+# load and scan the whole file every time.
+#
+# social_data.json is only a snapshot. Every change is first appended as one
+# JSON line to social_data.log, and a background thread folds the log into a
+# new snapshot now and then. On startup the snapshot is loaded and the log is
+# replayed on top of it, so a crash never loses or corrupts a finished write.
+class SocialStore:
+    def __init__(self, path, fsync=True, compact_every=1000, compact_interval=60):
+        self.path = path
+        self.log_path = os.path.splitext(path)[0] + ".log"
+        self.fsync = fsync
+        self.compact_every = compact_every        # log entries before compacting
+        self.compact_interval = compact_interval  # seconds between compactions
+        self.lock = threading.RLock()        # in-memory state: readers, and applying a change
+        self.write_lock = threading.RLock()  # one writer at a time, held while logging and fsyncing
+        self.compact_lock = threading.Lock()
+        self.compact_wanted = threading.Event()
+        self.compactor = None
+        self.log_file = None
+        self.log_entries = 0
+        self.seq = 0              # number of the last change applied
+        self.users = []
+        self.users_by_name = {}   # username -> user record
+        self.identities = {}      # username -> {"username", "role", "id"} for logged in users
+        self.posts = {}           # post id -> post
+        self.post_owner = {}      # post id -> user record
+        self.post_ids = []        # every post id, oldest first
+        self.author_post_ids = {}   # username -> that user's post ids, oldest first
+        self.hashtag_post_ids = {}  # normalized hashtag -> post ids, oldest first
+        self.load()
+
+    # Load the snapshot, replay the log and build the indexes
+    def load(self):
+        with self.write_lock, self.lock:
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f, phase("json_load"):
+                    try:
+                        social_data = json.load(f)
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"Error reading social data from {self.path}: {e}")
+            else:
+                social_data = {"users": []}
+
+            self.seq = social_data.get("seq", 0)
+            self.users = social_data.get("users", [])
+            self.users_by_name = {}
+            self.identities = {}
+            self.posts = {}
+            self.post_owner = {}
+            self.author_post_ids = {}
+            self.hashtag_post_ids = {}
+            for user in self.users:
+                user.setdefault("posts", [])
+                if user["username"] != "Deleted Account":
+                    self.users_by_name.setdefault(user["username"], user)
+                for post in user["posts"]:
+                    self.posts[post["id"]] = post
+                    self.post_owner[post["id"]] = user
+            self.post_ids = sorted(self.post_owner)
+            for post_id in self.post_ids:
+                self.index_post(post_id)
+
+            self.replay_log()
+        self.compact()
+
+    def replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+
+        good_size = 0
+        with open(self.log_path, "rb") as f, phase("json_load"):
+            for line in f:
+                # A line without a newline was cut off by a crash mid-write
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                good_size += len(line)
+                if record["seq"] > self.seq:
+                    try:
+                        self.check(record)
+                    except ValueError as e:
+                        # Written by an older version without these checks
+                        log.warning("Skipping social data log entry %s: %s", record["seq"], e)
+                        continue
+                    self.apply(record)
+                    self.seq = record["seq"]
+
+        # Drop the torn tail so new entries start on a clean line
+        if good_size < os.path.getsize(self.log_path):
+            with open(self.log_path, "r+b") as f:
+                f.truncate(good_size)
+
+    # Check a change, write it to the log, then apply it in memory. Only
+    # writers wait for the disk; readers just wait for the apply step.
+    def commit(self, record):
+        with self.write_lock:
+            record["seq"] = self.seq + 1
+            self.check(record)
+            with phase("json_dump"):
+                line = json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+            with phase("fsync"):
+                if self.log_file is None:
+                    self.log_file = open(self.log_path, "ab")
+                self.log_file.write(line)
+                self.log_file.flush()
+                if self.fsync:
+                    os.fsync(self.log_file.fileno())
+
+            with self.lock:
+                result = self.apply(record)
+                self.seq = record["seq"]
+            self.log_entries += 1
+            if self.log_entries >= self.compact_every:
+                self.compact_wanted.set()
+            return result
+
+    # Raise ValueError unless apply() can apply the record, so nothing that
+    # can't be replayed ever ends up in the log
+    def check(self, record):
+        op = record.get("op")
+        if op == "user-registered":
+            user = record.get("user")
+            ok = (isinstance(user, dict) and isinstance(user.get("username"), str)
+                  and isinstance(user.get("posts"), list) and user["username"] != "Deleted Account"
+                  and not self.is_user(user["username"]))
+        elif op == "user-renamed":
+            new_username = record.get("new_username")
+            ok = (self.is_user(record.get("username")) and isinstance(new_username, str)
+                  and (new_username == "Deleted Account" or not self.is_user(new_username)))
+        elif op == "user-role-changed":
+            ok = self.is_user(record.get("username")) and isinstance(record.get("role"), str)
+        elif op == "post-created":
+            post = record.get("post")
+            ok = (self.is_user(record.get("username")) and isinstance(post, dict) and isinstance(post.get("id"), int)
+                  and (not self.post_ids or post["id"] > self.post_ids[-1]))
+        elif op == "post-deleted":
+            ok = isinstance(record.get("id"), int) and record["id"] in self.post_owner
+        else:
+            ok = False
+        if not ok:
+            raise ValueError(f"Invalid social data change: {record}")
+
+    def is_user(self, username):
+        return isinstance(username, str) and username in self.users_by_name
+
+    def apply(self, record):
+        op = record["op"]
+        if op == "user-registered":
+            return self.apply_user_registered(record["user"])
+        if op == "user-renamed":
+            return self.apply_user_renamed(record["username"], record["new_username"])
+        if op == "user-role-changed":
+            return self.apply_user_role_changed(record["username"], record["role"])
+        if op == "post-created":
+            return self.apply_post_created(record["username"], record["post"])
+        if op == "post-deleted":
+            return self.apply_post_deleted(record["id"])
+        raise ValueError(f"Unknown social data log entry: {op}")
+
+    def apply_user_registered(self, user):
+        self.users.append(user)
+        self.users_by_name[user["username"]] = user
+        return user
+
+    def apply_user_renamed(self, username, new_username):
+        self.identities.pop(username, None)
+        self.identities.pop(new_username, None)
+        user = self.users_by_name.pop(username)
+        user["username"] = new_username
+        post_ids = self.author_post_ids.pop(username, [])
+        if new_username != "Deleted Account":
+            self.users_by_name[new_username] = user
+            self.author_post_ids[new_username] = post_ids
+        return user
+
+    def apply_user_role_changed(self, username, role):
+        self.identities.pop(username, None)
+        user = self.users_by_name[username]
+        user["role"] = role
+        return user
+
+    def apply_post_created(self, username, post):
+        user = self.users_by_name[username]
+        user["posts"].insert(0, post)
+        self.posts[post["id"]] = post
+        self.post_owner[post["id"]] = user
+        self.post_ids.append(post["id"])
+        self.index_post(post["id"])
+        return post
+
+    def apply_post_deleted(self, post_id):
+        self.unindex_post(post_id)
+        user = self.post_owner.pop(post_id)
+        post = self.posts.pop(post_id)
+        user["posts"].remove(post)
+        del self.post_ids[bisect_left(self.post_ids, post_id)]
+        return post
+
+    # Secondary indexes: author -> post ids and hashtag -> post ids.
+    # Posts are indexed in id order, so appending keeps the lists sorted.
+    def index_post(self, post_id):
+        username = self.post_owner[post_id]["username"]
+        if username != "Deleted Account":
+            self.author_post_ids.setdefault(username, []).append(post_id)
+        for tag in self.post_hashtags(post_id):
+            self.hashtag_post_ids.setdefault(tag, []).append(post_id)
+
+    def unindex_post(self, post_id):
+        username = self.post_owner[post_id]["username"]
+        if username in self.author_post_ids:
+            self.remove_id(self.author_post_ids, username, post_id)
+        for tag in self.post_hashtags(post_id):
+            self.remove_id(self.hashtag_post_ids, tag, post_id)
+
+    @staticmethod
+    def remove_id(index, key, post_id):
+        post_ids = index[key]
+        i = bisect_left(post_ids, post_id)
+        if i < len(post_ids) and post_ids[i] == post_id:
+            del post_ids[i]
+        if not post_ids:
+            del index[key]
+
+    def post_hashtags(self, post_id):
+        return hashtag_names(self.posts[post_id].get("hashtags"))
+
+    # Fold the log into a new snapshot. The snapshot is written to a temp file
+    # and swapped in with os.replace, so the old one stays intact until then.
+    # Only writers are held up while the data is copied; readers never are.
+    def compact(self):
+        with self.compact_lock:
+            with self.write_lock:
+                if self.log_file:
+                    log_size = self.log_file.tell()
+                else:
+                    log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+                if log_size == 0 and os.path.exists(self.path):
+                    return
+                seq = self.seq
+                # Posts are never edited, so copying the lists is enough
+                users = [dict(user, posts=list(user["posts"])) for user in self.users]
+
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                with phase("json_dump"):
+                    json.dump({"seq": seq, "users": users}, f, indent=4)
+                with phase("fsync"):
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+            # Keep only the log entries written while the snapshot was saved
+            with self.write_lock:
+                if self.log_file:
+                    self.log_file.close()
+                    self.log_file = None
+                if os.path.exists(self.log_path):
+                    with open(self.log_path, "rb") as f:
+                        f.seek(log_size)
+                        rest = f.read()
+                    with open(self.log_path + ".tmp", "wb") as f:
+                        f.write(rest)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(self.log_path + ".tmp", self.log_path)
+                    self.log_entries = rest.count(b"\n")
+
+    def start_compactor(self):
+        if self.compactor is not None:
+            return
+        self.compactor = threading.Thread(target=self.compact_loop, name="social-store-compactor", daemon=True)
+        self.compactor.start()
+
+    def compact_loop(self):
+        while True:
+            self.compact_wanted.wait(self.compact_interval)
+            self.compact_wanted.clear()
+            if self.log_entries:
+                # Keep going if it fails (disk full, say); the log just grows until it works again
+                try:
+                    self.compact()
+                except Exception:
+                    log.exception("Compacting %s failed", self.path)
+
+    def get_user(self, username):
+        return self.users_by_name.get(username)
+
+    # Who a JWT identity is, cached until the user is renamed or changes role
+    def get_identity(self, username):
+        identity = self.identities.get(username)
+        if identity is None:
+            with self.lock:
+                user = self.users_by_name.get(username)
+                if user is None:
+                    return None
+                identity = {"username": user["username"], "role": user.get("role", "User"), "id": user["id"]}
+                self.identities[username] = identity
+        return identity
+
+    def add_user(self, user_id, username, role="User"):
+        with self.write_lock:
+            if username == "Deleted Account" or self.is_user(username):
+                return None
+            new_user_data = {
+                "id": user_id,
+                "username": username,
+                "role": role,
+                "user-made": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()),
+                "posts": [],
+                "following": [],
+                "followers": []
+            }
+            return self.commit({"op": "user-registered", "user": new_user_data})
+
+    # Mark an account as deleted. Its posts stay in the feed under the new name.
+    def rename_user(self, username, new_username):
+        with self.write_lock:
+            if username not in self.users_by_name:
+                return None
+            return self.commit({"op": "user-renamed", "username": username, "new_username": new_username})
+
+    def set_role(self, username, role):
+        with self.write_lock:
+            if username not in self.users_by_name:
+                return None
+            return self.commit({"op": "user-role-changed", "username": username, "role": role})
+
+    def add_post(self, username, message, hashtags):
+        with self.write_lock:
+            if username not in self.users_by_name:
+                return None
+
+            # Post ids are millisecond timestamps; never reuse or go backwards
+            post_id = int(time.time() * 1000)
+            if self.post_ids and post_id <= self.post_ids[-1]:
+                post_id = self.post_ids[-1] + 1
+
+            post = {
+                "id": post_id,
+                "message": message,
+                "hashtags": hashtags,
+                "timestamp": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+            }
+            return self.commit({"op": "post-created", "username": username, "post": post})
+
+    # Delete a post. If owner (a username) is given, only delete it if that user wrote it.
+    def delete_post(self, post_id, owner=None):
+        with self.write_lock:
+            user = self.post_owner.get(post_id)
+            if user is None or (owner is not None and user is not self.users_by_name.get(owner)):
+                return None
+            return self.commit({"op": "post-deleted", "id": post_id})
+
+    # Newest posts first, with the author's current username attached.
+    # If before is given, the page starts with the first post older than it.
+    def latest_posts(self, limit=30, before=None):
+        with self.lock:
+            return self.page(self.post_ids, limit, before)
+
+    # Returns None if there is no such user
+    def user_posts(self, username, limit=30, before=None):
+        with self.lock:
+            if username not in self.users_by_name:
+                return None
+            return self.page(self.author_post_ids.get(username, []), limit, before)
+
+    def hashtag_posts(self, tag, limit=30, before=None):
+        with self.lock:
+            return self.page(self.hashtag_post_ids.get(normalize_hashtag(tag), []), limit, before)
+
+    def list_users(self):
+        with self.lock:
+            return [{"id": user["id"], "username": user["username"], "role": user.get("role", "User")}
+                    for user in self.users_by_name.values()]
+
+    def page(self, post_ids, limit, before):
+        end = len(post_ids) if before is None else bisect_left(post_ids, before)
+        posts_to_return = []
+        for post_id in reversed(post_ids[max(end - limit, 0):end]):
+            posts_to_return.append(self.with_username(post_id))
+        return posts_to_return
+
+    def with_username(self, post_id):
+        post_with_user = self.posts[post_id].copy()
+        post_with_user["username"] = self.post_owner[post_id]["username"]
+        return post_with_user
+
+
+# "#Flask", "flask" and " #FLASK " are all the same hashtag
+def normalize_hashtag(tag):
+    return tag.strip().lstrip("#").lower()
+
+
+# The normalized hashtags of a post. Anything that isn't a list of strings
+# (old data, or a bad request that got through) just has no hashtags.
+def hashtag_names(hashtags):
+    if not isinstance(hashtags, list):
+        return set()
+    return {normalize_hashtag(tag) for tag in hashtags if isinstance(tag, str) and normalize_hashtag(tag)}
@@ -0,0 +1,179 @@
+import time
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, SocialUser, Post, Hashtag, DataVersion, post_hashtag
+from social_store import normalize_hashtag, hashtag_names
+
+
+# Same interface as SocialStore, but the social data lives in the SQL
+# database, so several gunicorn workers or hosts can share it. Every page is
+# one indexed query: the timeline walks the post primary key, user pages use
+# (author_id, id) and hashtag pages use the post_hashtag primary key.
+#
+# Must be used inside an app context (any request handler is).
+class SqlSocialStore:
+    # How often add_post retries if another worker took the same post id
+    MAX_RETRIES = 5
+
+    # Create the tables and the data version row
+    def setup(self):
+        db.create_all()
+        if db.session.get(DataVersion, 1) is None:
+            db.session.add(DataVersion(id=1, version=0))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+
+    # Goes up with every change made by any worker
+    @property
+    def seq(self):
+        return db.session.execute(db.select(DataVersion.version).where(DataVersion.id == 1)).scalar() or 0
+
+    def bump_version(self):
+        db.session.execute(db.update(DataVersion).where(DataVersion.id == 1).values(version=DataVersion.version + 1))
+
+    def live_user(self, username):
+        if username == "Deleted Account":
+            return None
+        return db.session.execute(db.select(SocialUser).filter_by(username=username)).scalars().first()
+
+    # Nothing is cached here: other workers can change a user at any time,
+    # and the lookup is a single indexed query.
+    def get_identity(self, username):
+        user = self.live_user(username)
+        if user is None:
+            return None
+        return {"username": user.username, "role": user.role, "id": user.user_id}
+
+    def add_user(self, user_id, username, role="User"):
+        if username == "Deleted Account":
+            return None
+        user = SocialUser(user_id=user_id, username=username, role=role,
+                          user_made=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()))
+        db.session.add(user)
+        self.bump_version()
+        db.session.commit()
+        return user
+
+    def rename_user(self, username, new_username):
+        user = self.live_user(username)
+        if user is None:
+            return None
+        user.username = new_username
+        self.bump_version()
+        db.session.commit()
+        return user
+
+    def set_role(self, username, role):
+        user = self.live_user(username)
+        if user is None:
+            return None
+        user.role = role
+        self.bump_version()
+        db.session.commit()
+        return user
+
+    def add_post(self, username, message, hashtags):
+        tag_names = hashtag_names(hashtags)
+
+        for attempt in range(self.MAX_RETRIES):
+            user = self.live_user(username)
+            if user is None:
+                return None
+
+            # Post ids are millisecond timestamps; never reuse or go backwards
+            last_id = db.session.execute(db.select(db.func.max(Post.id))).scalar() or 0
+            post = Post(id=max(int(time.time() * 1000), last_id + 1), author_id=user.id, message=message,
+                        hashtags=hashtags, timestamp=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()))
+            post.tags = self.get_or_create_hashtags(tag_names)
+            new_tag_names = [hashtag.name for hashtag in post.tags if hashtag.id is None]
+            db.session.add(post)
+            try:
+                self.bump_version()  # flushes the post, so a collision can show up here
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                # Retry if another worker took the id (or created one of the hashtags)
+                # in the meantime; anything else is a real error
+                if self.taken(post.id, new_tag_names):
+                    continue
+                raise
+            return post_dict(post)
+        raise RuntimeError("Could not store post, too many id collisions")
+
+    @staticmethod
+    def taken(post_id, tag_names):
+        if db.session.get(Post, post_id) is not None:
+            return True
+        return bool(tag_names) and db.session.execute(
+            db.select(Hashtag.id).where(Hashtag.name.in_(tag_names))).first() is not None
+
+    def get_or_create_hashtags(self, tag_names):
+        if not tag_names:
+            return []
+        existing = db.session.execute(db.select(Hashtag).where(Hashtag.name.in_(tag_names))).scalars().all()
+        found = {hashtag.name for hashtag in existing}
+        return existing + [Hashtag(name=name) for name in tag_names - found]
+
+    # Delete a post. If owner (a username) is given, only delete it if that user wrote it.
+    def delete_post(self, post_id, owner=None):
+        post = db.session.get(Post, post_id)
+        if post is None:
+            return None
+        if owner is not None:
+            user = self.live_user(owner)
+            if user is None or post.author_id != user.id:
+                return None
+
+        deleted = post_dict(post)
+        db.session.delete(post)
+        self.bump_version()
+        db.session.commit()
+        return deleted
+
+    # Newest posts first, with the author's current username attached.
+    # If before is given, the page starts with the first post older than it.
+    def latest_posts(self, limit=30, before=None):
+        return self.page(self.posts_query(), limit, before)
+
+    # Returns None if there is no such user
+    def user_posts(self, username, limit=30, before=None):
+        user = self.live_user(username)
+        if user is None:
+            return None
+        return self.page(self.posts_query().where(Post.author_id == user.id), limit, before)
+
+    def hashtag_posts(self, tag, limit=30, before=None):
+        query = (self.posts_query()
+                 .join(post_hashtag, post_hashtag.c.post_id == Post.id)
+                 .join(Hashtag, Hashtag.id == post_hashtag.c.hashtag_id)
+                 .where(Hashtag.name == normalize_hashtag(tag)))
+        return self.page(query, limit, before)
+
+    def list_users(self):
+        rows = db.session.execute(
+            db.select(SocialUser.user_id, SocialUser.username, SocialUser.role)
+            .where(SocialUser.username != "Deleted Account")
+            .order_by(SocialUser.id)
+        ).all()
+        return [{"id": user_id, "username": username, "role": role} for user_id, username, role in rows]
+
+    @staticmethod
+    def posts_query():
+        return db.select(Post, SocialUser.username).join(SocialUser, Post.author_id == SocialUser.id)
+
+    @staticmethod
+    def page(query, limit, before):
+        if before is not None:
+            query = query.where(Post.id < before)
+        rows = db.session.execute(query.order_by(Post.id.desc()).limit(limit)).all()
+        return [post_dict(post, username) for post, username in rows]
+
+
+def post_dict(post, username=None):
+    post_data = {"id": post.id, "message": post.message, "hashtags": post.hashtags, "timestamp": post.timestamp}
+    if username is not None:
+        post_data["username"] = username
+    return post_data
@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from password_pool import PasswordPool, PoolBusy
+
+
+def test_pool_recovers_from_a_dead_worker():
+    pool = PasswordPool(workers=2, max_pending=2, rounds=4)
+    pool.start()
+    if pool.kind != "process":
+        # With the thread fallback (no fork, e.g. Windows) os._exit would end the test run
+        pytest.skip("needs worker processes")
+    password_hash = pool.hash("secret")
+
+    # Kill the worker running the call; the pool breaks and the caller gets PoolBusy
+    with pytest.raises(PoolBusy):
+        pool.run(os._exit, 1)
+
+    # Slots were all given back, and the calls go to threads from now on
+    for _ in range(pool.max_pending + 1):
+        assert pool.check(password_hash, "secret")
+    metrics = pool.metrics()
+    assert metrics["in_flight"] == 0
+    assert metrics["restarts"] == 1
+    assert metrics["kind"] == "thread"
+
+
+def test_pool_turns_away_calls_over_max_pending():
+    pool = PasswordPool(workers=1, max_pending=1, rounds=4)
+    pool.slots.acquire()
+    with pytest.raises(PoolBusy):
+        pool.hash("secret")
+    assert pool.metrics()["rejected"] == 1
@@ -0,0 +1,35 @@
+from pubsub import EventHub
+
+
+def drain(sub):
+    events = []
+    while not sub.queue.empty():
+        events.append(sub.queue.get_nowait())
+    return events
+
+
+def test_resume_from_last_event_id():
+    hub = EventHub()
+    first = hub.publish("post-created", {"id": 1})
+    hub.publish("post-created", {"id": 2})
+    hub.publish("post-deleted", {"id": 1})
+
+    missed = drain(hub.subscribe(first.id))
+    assert [event.type for event in missed] == ["post-created", "post-deleted"]
+    assert drain(hub.subscribe(missed[-1].id)) == []
+
+
+def test_ids_from_another_process_get_a_reset():
+    old = EventHub()
+    for i in range(5):
+        old.publish("post-created", {"id": i})
+    # After a restart (or on another worker) the numbers start over
+    hub = EventHub()
+    hub.publish("post-created", {"id": 10})
+    hub.publish("post-created", {"id": 11})
+
+    for last_event_id in (old.history[0].id, old.history[-1].id, "3", "garbage"):
+        events = drain(hub.subscribe(last_event_id))
+        assert [event.type for event in events] == ["reset"]
+        # Resuming from the reset event needs nothing more
+        assert drain(hub.subscribe(events[0].id)) == []
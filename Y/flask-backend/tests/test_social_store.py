@@ -0,0 +1,182 @@
+import os
+import sys
+import json
+import subprocess
+import time
+
+import pytest
+
+from social_store import SocialStore, hashtag_names
+
+BACKEND = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Writes posts (and deletes every third one) forever, printing each change
+# only after SocialStore.commit() has returned. Compacts every 20 changes.
+# Post ids can be handed out again after a delete, so changes are tracked by
+# message instead.
+WRITER = """
+import sys
+sys.path.insert(0, {backend!r})
+from social_store import SocialStore
+store = SocialStore({path!r}, compact_every=20, compact_interval=0.01)
+store.start_compactor()
+if not store.get_user("writer"):
+    store.add_user(1, "writer")
+i = 0
+while True:
+    post = store.add_post("writer", "round {round} post %d" % i, ["#Round{round}", "#all"])
+    print("created", {round}, i, flush=True)
+    if i % 3 == 0:
+        store.delete_post(post["id"])
+        print("deleted", {round}, i, flush=True)
+    i += 1
+"""
+
+
+def assert_consistent(store):
+    posts = {post["id"]: (user["username"], post) for user in store.users for post in user["posts"]}
+    assert store.post_ids == sorted(posts)
+    assert set(store.posts) == set(posts) == set(store.post_owner)
+
+    author_post_ids = {}
+    hashtag_post_ids = {}
+    for post_id in sorted(posts):
+        username, post = posts[post_id]
+        author_post_ids.setdefault(username, []).append(post_id)
+        for tag in hashtag_names(post["hashtags"]):
+            hashtag_post_ids.setdefault(tag, []).append(post_id)
+    assert store.author_post_ids == author_post_ids
+    assert store.hashtag_post_ids == hashtag_post_ids
+
+
+def test_kill_between_writes(tmp_path):
+    path = str(tmp_path / "social_data.json")
+    kept = set()     # created and never deleted
+    deleted = set()
+
+    for round in range(4):
+        writer = subprocess.Popen(
+            [sys.executable, "-c", WRITER.format(backend=BACKEND, path=path, round=round)],
+            stdout=subprocess.PIPE, text=True)
+        # Kill it at a different point each round, usually mid-compaction
+        for _ in range(60 + 45 * round):
+            action, writer_round, i = writer.stdout.readline().split()
+            message = f"round {writer_round} post {i}"
+            if action == "deleted":
+                deleted.add(message)
+            elif int(i) % 3:
+                kept.add(message)
+        writer.kill()  # SIGKILL, or TerminateProcess on Windows
+        writer.wait()
+
+        store = SocialStore(path)
+        assert_consistent(store)
+        # Every change the writer saw finish survived the kill
+        messages = {post["message"] for post in store.posts.values()}
+        assert kept <= messages
+        assert not deleted & messages
+        assert store.seq >= 1 + len(kept) + 2 * len(deleted)
+
+        # Loading again (after the compaction on load) gives the same state
+        reloaded = SocialStore(path)
+        assert reloaded.seq == store.seq
+        assert reloaded.posts == store.posts
+
+
+def test_torn_log_line_is_truncated(tmp_path):
+    path = str(tmp_path / "social_data.json")
+    store = SocialStore(path, compact_every=1000)
+    store.add_user(1, "alice")
+    post = store.add_post("alice", "kept", ["#a"])
+    log_size = os.path.getsize(store.log_path)
+    store.log_file.close()
+
+    with open(store.log_path, "ab") as f:
+        f.write(b'{"op":"post-created","username":"alice","po')
+
+    store = SocialStore(path)
+    assert_consistent(store)
+    assert store.seq == 2
+    assert list(store.posts) == [post["id"]]
+    # The snapshot now holds everything and the torn line is gone
+    assert os.path.getsize(store.log_path) == 0
+    assert log_size > 0
+
+
+def test_invalid_change_is_not_logged(tmp_path):
+    store = SocialStore(str(tmp_path / "social_data.json"))
+    store.add_user(1, "alice")
+    seq = store.seq
+    log_size = store.log_file.tell()
+
+    with pytest.raises(ValueError):
+        store.commit({"op": "post-deleted", "id": 12345})
+    with pytest.raises(ValueError):
+        store.commit({"op": "user-renamed", "username": "nobody", "new_username": "x"})
+
+    assert store.seq == seq
+    assert store.log_file.tell() == log_size
+
+
+def test_non_list_hashtags_survive_a_restart(tmp_path):
+    path = str(tmp_path / "social_data.json")
+    store = SocialStore(path)
+    store.add_user(1, "alice")
+    post = store.add_post("alice", "hi", 5)
+    assert store.user_posts("alice")[0]["id"] == post["id"]
+    store.log_file.close()
+
+    store = SocialStore(path)
+    assert_consistent(store)
+    assert post["id"] in store.posts
+
+
+def test_invalid_log_entry_is_skipped_on_replay(tmp_path):
+    path = str(tmp_path / "social_data.json")
+    store = SocialStore(path)
+    store.add_user(1, "alice")
+    store.log_file.close()
+
+    with open(store.log_path, "ab") as f:
+        f.write(json.dumps({"seq": 2, "op": "post-deleted", "id": 99}).encode() + b"\n")
+        f.write(json.dumps({"seq": 3, "op": "user-role-changed", "username": "alice", "role": "Admin"}).encode() + b"\n")
+
+    store = SocialStore(path)
+    assert store.seq == 3
+    assert store.get_identity("alice")["role"] == "Admin"
+
+
+def test_deleted_account_cannot_register(tmp_path):
+    path = str(tmp_path / "social_data.json")
+    store = SocialStore(path)
+    assert store.add_user(1, "Deleted Account") is None
+    with pytest.raises(ValueError):
+        store.commit({"op": "user-registered", "user": {"id": 1, "username": "Deleted Account", "posts": []}})
+
+    # A replayed log and a loaded snapshot agree
+    for _ in range(2):
+        store = SocialStore(path)
+        assert store.get_identity("Deleted Account") is None
+        assert store.list_users() == []
+
+
+def test_compactor_survives_a_failed_compaction(tmp_path):
+    store = SocialStore(str(tmp_path / "social_data.json"), compact_interval=0.01)
+    compact = store.compact
+    failures = []
+
+    def fail_once():
+        if not failures:
+            failures.append(True)
+            raise OSError("No space left on device")
+        compact()
+
+    store.compact = fail_once
+    store.add_user(1, "alice")
+    store.start_compactor()
+    deadline = time.monotonic() + 5
+    while store.log_entries and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert failures
+    assert store.log_entries == 0
+    assert store.compactor.is_alive()
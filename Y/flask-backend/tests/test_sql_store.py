@@ -0,0 +1,182 @@
+import pytest
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from models import db, init_db, SocialUser, Post, Hashtag, Follow
+from social_store import SocialStore
+from sql_store import SqlSocialStore
+from migrate_social_data import migrate
+
+
+@pytest.fixture
+def sql_store(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'y.db'}")
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        store = SqlSocialStore()
+        store.setup()
+        yield store
+        db.session.remove()
+
+
+def test_add_and_delete_post(sql_store):
+    sql_store.add_user(1, "alice")
+    sql_store.add_user(2, "bob")
+    post = sql_store.add_post("alice", "hello", ["#Flask"])
+    assert sql_store.add_post("nobody", "hello", []) is None
+
+    # Only the author can delete it, unless no owner is given (admins)
+    assert sql_store.delete_post(post["id"], owner="bob") is None
+    assert sql_store.delete_post(post["id"], owner="nobody") is None
+    assert sql_store.delete_post(post["id"], owner="alice")["id"] == post["id"]
+    assert sql_store.delete_post(post["id"]) is None
+    assert sql_store.latest_posts() == []
+    assert sql_store.hashtag_posts("flask") == []
+
+    post = sql_store.add_post("bob", "again", [])
+    assert sql_store.delete_post(post["id"])["message"] == "again"
+
+
+def test_bad_post_is_not_retried(sql_store):
+    sql_store.add_user(1, "alice")
+    with pytest.raises(IntegrityError):
+        sql_store.add_post("alice", None, ["#new"])
+    assert sql_store.latest_posts() == []
+    assert sql_store.add_post("alice", "fine", ["#new"])["message"] == "fine"
+
+
+def test_post_id_collision_is_retried(sql_store):
+    sql_store.add_user(1, "alice")
+    collisions = []
+
+    # Another worker stores a post with the same id just before this one is flushed
+    @event.listens_for(db.session, "before_flush")
+    def other_worker(session, flush_context, instances):
+        for post in session.new:
+            if isinstance(post, Post) and not collisions:
+                collisions.append(post.id)
+                with db.engine.begin() as conn:
+                    conn.execute(db.insert(Post).values(id=post.id, author_id=post.author_id, message="other",
+                                                        hashtags=[], timestamp=""))
+
+    try:
+        post = sql_store.add_post("alice", "mine", [])
+    finally:
+        event.remove(db.session, "before_flush", other_worker)
+    assert post["id"] > collisions[0]
+    assert [p["message"] for p in sql_store.latest_posts()] == ["mine", "other"]
+
+
+def test_post_ids_go_up(sql_store):
+    sql_store.add_user(1, "alice")
+    ids = [sql_store.add_post("alice", str(i), [])["id"] for i in range(20)]
+    assert ids == sorted(set(ids))
+
+
+def test_rename_user_to_deleted_account(sql_store):
+    sql_store.add_user(1, "alice")
+    sql_store.add_post("alice", "hello", [])
+    seq = sql_store.seq
+
+    assert sql_store.rename_user("alice", "Deleted Account")
+    assert sql_store.seq > seq
+    assert sql_store.get_identity("alice") is None
+    assert sql_store.get_identity("Deleted Account") is None
+    assert sql_store.rename_user("Deleted Account", "mallory") is None
+    assert sql_store.list_users() == []
+    assert sql_store.user_posts("alice") is None
+    # The posts stay, under the new name
+    assert [post["username"] for post in sql_store.latest_posts()] == ["Deleted Account"]
+
+    assert sql_store.add_user(3, "Deleted Account") is None
+
+    # The name can be registered again
+    sql_store.add_user(2, "alice")
+    assert sql_store.get_identity("alice") == {"username": "alice", "role": "User", "id": 2}
+    assert sql_store.user_posts("alice") == []
+
+
+def test_set_role(sql_store):
+    sql_store.add_user(1, "alice")
+    assert sql_store.set_role("alice", "Admin")
+    assert sql_store.get_identity("alice")["role"] == "Admin"
+    assert sql_store.list_users() == [{"id": 1, "username": "alice", "role": "Admin"}]
+    assert sql_store.set_role("nobody", "Admin") is None
+
+
+def test_pagination(sql_store):
+    sql_store.add_user(1, "alice")
+    sql_store.add_user(2, "bob")
+    ids = [sql_store.add_post("alice" if i % 2 else "bob", str(i), ["#all"])["id"] for i in range(25)]
+    newest_first = ids[::-1]
+
+    first = sql_store.latest_posts(limit=10)
+    assert [post["id"] for post in first] == newest_first[:10]
+    second = sql_store.latest_posts(limit=10, before=first[-1]["id"])
+    assert [post["id"] for post in second] == newest_first[10:20]
+    last = sql_store.latest_posts(limit=10, before=second[-1]["id"])
+    assert [post["id"] for post in last] == newest_first[20:]
+    assert sql_store.latest_posts(limit=10, before=ids[0]) == []
+
+    alice_ids = ids[1::2][::-1]
+    page = sql_store.user_posts("alice", limit=5, before=alice_ids[2])
+    assert [post["id"] for post in page] == alice_ids[3:8]
+    assert {post["username"] for post in page} == {"alice"}
+    assert [post["id"] for post in sql_store.hashtag_posts("all", limit=3, before=ids[5])] == ids[2:5][::-1]
+
+
+def test_hashtags_are_normalized(sql_store):
+    sql_store.add_user(1, "alice")
+    first = sql_store.add_post("alice", "one", ["#Flask", " flask ", "#"])
+    second = sql_store.add_post("alice", "two", ["FLASK", "#python"])
+    sql_store.add_post("alice", "three", 5)
+
+    assert db.session.execute(db.select(Hashtag.name).order_by(Hashtag.name)).scalars().all() == ["flask", "python"]
+    for tag in ("flask", "#Flask", " #FLASK"):
+        assert [post["id"] for post in sql_store.hashtag_posts(tag)] == [second["id"], first["id"]]
+    # The post keeps the hashtags as written
+    assert sql_store.latest_posts()[-1]["hashtags"] == ["#Flask", " flask ", "#"]
+
+
+def test_migrate_matches_social_store(sql_store, tmp_path):
+    path = str(tmp_path / "social_data.json")
+    store = SocialStore(path)
+    store.add_user(1, "alice")
+    store.add_user(2, "bob")
+    store.add_user(3, "carol")
+    store.set_role("bob", "Moderator")
+    store.users_by_name["alice"]["following"] = ["bob", 3]
+    store.users_by_name["carol"]["followers"] = ["bob"]
+    for i in range(12):
+        store.add_post(["alice", "bob", "carol"][i % 3], f"post {i}", ["#Flask", f"#n{i % 2}"] if i % 4 else 5)
+    store.delete_post(store.post_ids[4])
+    store.rename_user("carol", "Deleted Account")
+    store.compact()
+
+    migrate(path)
+
+    def everything(s):
+        return {
+            "latest": s.latest_posts(limit=100),
+            "pages": [s.latest_posts(limit=4, before=before) for before in store.post_ids],
+            "users": sorted(s.list_users(), key=lambda user: user["id"]),
+            "identities": [s.get_identity(name) for name in ("alice", "bob", "carol", "Deleted Account")],
+            "user_posts": [s.user_posts(name) for name in ("alice", "bob", "carol")],
+            "hashtags": [s.hashtag_posts(tag) for tag in ("flask", "#N0", "n1", "none")],
+        }
+
+    assert everything(sql_store) == everything(store)
+    assert db.session.execute(db.select(db.func.count()).select_from(Post)).scalar() == 11
+    assert db.session.execute(db.select(db.func.count()).select_from(SocialUser)).scalar() == 3
+    by_name = {user.username: user.id for user in db.session.execute(db.select(SocialUser)).scalars()}
+    follows = set(db.session.execute(db.select(Follow.follower_id, Follow.followed_id)).all())
+    assert follows == {(by_name["alice"], by_name["bob"]), (by_name["alice"], by_name["Deleted Account"]),
+                       (by_name["bob"], by_name["Deleted Account"])}
+
+    # New posts carry on after the migrated ids
+    assert sql_store.add_post("alice", "new", [])["id"] > store.post_ids[-1]
+
+    with pytest.raises(SystemExit):
+        migrate(path)
@@ -17,10 +17,10 @@ const Notfic: React.FC = () => {
     const fetchNotifications = async () => {
       const token = localStorage.getItem("token");
       try {
-        const response = await axios.get("/protected", {
+        const response = await axios.get("/me", {
           headers: { Authorization: `Bearer ${token}` },
         });
-        const username = response.data.message.split(", ")[1];
+        const username = response.data.username;
 
         // Fetch the user data to get notifications
         const userResponse = await axios.get("/users");
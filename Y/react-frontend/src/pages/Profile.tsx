@@ -23,17 +23,16 @@ const Profile: React.FC = () => {
   useEffect(() => {
     const fetchUsernameAndPosts = async () => {
       try {
-        const response = await axios.get("/protected", {
+        const response = await axios.get("/me", {
           headers: { Authorization: `Bearer ${localStorage.getItem("token")}` },
         });
-        const loggedInUsername = response.data.message.split(", ")[1];
+        const loggedInUsername = response.data.username;
         setUsername(loggedInUsername);
 
-        const postsResponse = await axios.get("/posts");
-        const userPosts = postsResponse.data.posts.filter(
-          (post: Post) => post.username === loggedInUsername
+        const postsResponse = await axios.get(
+          `/users/${encodeURIComponent(loggedInUsername)}/posts`
         );
-        setPosts(userPosts);
+        setPosts(postsResponse.data.posts);
       } catch (error) {
         console.error("Error fetching username and posts:", error);
         setErrorMessage("Failed to load profile data.");
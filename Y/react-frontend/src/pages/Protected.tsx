@@ -15,6 +15,7 @@ interface Post {
 
 const Protected: React.FC = () => {
   const [posts, setPosts] = useState<Post[]>([]);
+  const [nextBefore, setNextBefore] = useState<number | null>(null);
   const [postText, setPostText] = useState<string>("");
   const [hashtagInput, setHashtagInput] = useState<string>("");
   const [hashtags, setHashtags] = useState<string[]>([]);
@@ -36,12 +37,11 @@ const Protected: React.FC = () => {
         return;
       }
       try {
-        const response = await axios.get("/protected", {
+        const response = await axios.get("/me", {
           headers: { Authorization: `Bearer ${token}` },
         });
-        const parts = response.data.message.split(", ");
-        setUsername(parts[1]);
-        setRole(parts[2].replace("Role: ", "").trim());
+        setUsername(response.data.username);
+        setRole(response.data.role);
       } catch (err) {
         setUsername(null);
       }
@@ -55,6 +55,7 @@ const Protected: React.FC = () => {
       try {
         const response = await axios.get("/posts");
         setPosts(response.data.posts);
+        setNextBefore(response.data.next_before);
       } catch (err) {
         console.error(err);
       }
@@ -62,6 +63,38 @@ const Protected: React.FC = () => {
     fetchAllPosts();
   }, []);
 
+  // Live updates: new and deleted posts are pushed by the server
+  useEffect(() => {
+    const events = new EventSource("/posts/stream");
+    events.addEventListener("post-created", e => {
+      const post: Post = JSON.parse((e as MessageEvent).data);
+      setPosts(prev => (prev.some(p => p.id === post.id) ? prev : [post, ...prev]));
+    });
+    events.addEventListener("post-deleted", e => {
+      const { id } = JSON.parse((e as MessageEvent).data);
+      setPosts(prev => prev.filter(p => p.id !== id));
+    });
+    // Missed too many events while disconnected, so start over
+    events.addEventListener("reset", async () => {
+      const response = await axios.get("/posts");
+      setPosts(response.data.posts);
+      setNextBefore(response.data.next_before);
+    });
+    return () => events.close();
+  }, []);
+
+  // Fetch the next page of older posts
+  const loadMorePosts = async () => {
+    if (nextBefore === null) return;
+    try {
+      const response = await axios.get("/posts", { params: { before: nextBefore } });
+      setPosts(prev => [...prev, ...response.data.posts]);
+      setNextBefore(response.data.next_before);
+    } catch (err) {
+      console.error(err);
+    }
+  };
+
   // Handle creating a post
   const handlePost = async () => {
     if (!username) {
@@ -88,8 +121,8 @@ const Protected: React.FC = () => {
         setHashtags([]);
         setHashtagInput("");
         setErrorMessage("");
-        const fresh = await axios.get("/posts");
-        setPosts(fresh.data.posts);
+        const post: Post = res.data.post;
+        setPosts(prev => (prev.some(p => p.id === post.id) ? prev : [post, ...prev]));
       }
     } catch {
       setErrorMessage("An error occurred while posting.");
@@ -107,8 +140,7 @@ const Protected: React.FC = () => {
       await axios.delete(`/posts/${postId}`, {
         headers: { Authorization: `Bearer ${token}` },
       });
-      const fresh = await axios.get("/posts");
-      setPosts(fresh.data.posts);
+      setPosts(prev => prev.filter(p => p.id !== postId));
     } catch {
       setErrorMessage("Failed to delete post.");
     }
@@ -200,6 +232,9 @@ const Protected: React.FC = () => {
             <div className="hashtag-box"><p className="hashtags">{post.hashtags.join(" ")}</p></div>
           </div>
         ))}
+        {nextBefore !== null && (
+          <button className="post-button" onClick={loadMorePosts}>Load more</button>
+        )}
       </div>
     </div>
   );